@@ -1,23 +1,89 @@
 from __future__ import annotations
 
 import datetime as dt
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+from curl_cffi import CurlError
+from yfinance.exceptions import YFException
 
 from src.config import DCFConfig
-from src.model import dcf_one
-from src.sensitivity import sensitivity_grid
-from src.io_utils import read_tickers, to_powerbi_long
+from src.fetch import fetch_closes, fetch_fundamentals, prune_cache
+from src.model import dcf_from_flows, dcf_one, projected_flows
+from src.sensitivity import sensitivity_from_flows
+from src.io_utils import read_tickers, to_powerbi_long, write_csv, write_records_csv
 
 TICKER_FILE = "input/tickers.csv"
 
+# Fixed schema for the wide scenario output (one record per ticker, filled in place).
+# Text fields are object dtype: fixed-width "U" fields would silently truncate.
+SCENARIO_DTYPE = np.dtype([
+    ("ticker", "O"),
+    ("name", "O"),
+    ("current_price", "f8"),
+    ("conservative_price", "f8"),
+    ("base_price", "f8"),
+    ("optimistic_price", "f8"),
+    ("wacc", "f8"),
+    ("rf", "f8"),
+    ("tax_rate", "f8"),
+])
+
+
+# data problems (our own guards + malformed Yahoo payloads), yfinance's own errors
+# (rate limits, missing tickers, bad json) and network failures
+_TICKER_ERRORS = (
+    ValueError, KeyError, TypeError, IndexError, ZeroDivisionError, OSError,
+    YFException, CurlError
+)
+
 
 def _run_timestamp() -> str:
     # microseconds included so back-to-back runs never collide
     return dt.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
 
 
+def process_ticker(
+    symbol: str,
+    cfg: DCFConfig,
+    current_price: float | None = None
+) -> tuple[tuple, dict, list[dict]]:
+    """
+    Full per-ticker pipeline: scenarios + base details + sensitivity.
+    The scenario record is a tuple in SCENARIO_DTYPE field order.
+    current_price comes from the batched close download when available.
+    Runs on a worker thread: errors propagate to run(), which does all the reporting.
+    """
+    # --- fetch once, reuse for every scenario + sensitivity ---
+    fundamentals = fetch_fundamentals(symbol, current_price=current_price)
+
+    # --- scenarios (growth multiplier only); base flows are shared with the sensitivity grid ---
+    base_flows = projected_flows(symbol, cfg, cfg.growth_mult_base, fundamentals)
+    cons = dcf_one(symbol, cfg, growth_multiplier=cfg.growth_mult_conservative, fundamentals=fundamentals)
+    base = dcf_from_flows(symbol, base_flows)
+    opt  = dcf_one(symbol, cfg, growth_multiplier=cfg.growth_mult_optimistic, fundamentals=fundamentals)
+
+    scenario_record = (
+        symbol,
+        base["name"],
+        base["current_price"],
+        cons["dcf_price"],
+        base["dcf_price"],
+        opt["dcf_price"],
+        base["wacc"],
+        base["rf"],
+        base["tax_rate"],
+    )
+
+    # --- sensitivity (base scenario) ---
+    sens = sensitivity_from_flows(symbol, cfg, base_flows)
+
+    return scenario_record, base, sens
+
+
 def run() -> None:
     cfg = DCFConfig(region="AU")
 
@@ -25,62 +91,86 @@ def run() -> None:
     if "Ticker" not in tickers_df.columns:
         raise ValueError("Input file must contain a 'Ticker' column")
 
+    symbols = [s for s in (str(raw).strip() for raw in tickers_df["Ticker"]) if s]
+
     # ✅ Timestamped output folder (prevents overwrite)
     out_dir = Path("output") / f"{_run_timestamp()}"
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    scenario_rows = []
+    scenario_arr = np.empty(len(symbols), dtype=SCENARIO_DTYPE)
+    scenario_ok = np.zeros(len(symbols), dtype=bool)
     base_detail_rows = []
     sens_rows = []
 
-    for raw in tickers_df["Ticker"]:
-        symbol = str(raw).strip()
-        if not symbol:
-            continue
-
-        try:
-            # --- scenarios (growth multiplier only) ---
-            cons = dcf_one(symbol, cfg, growth_multiplier=cfg.growth_mult_conservative)
-            base = dcf_one(symbol, cfg, growth_multiplier=cfg.growth_mult_base)
-            opt  = dcf_one(symbol, cfg, growth_multiplier=cfg.growth_mult_optimistic)
-
-            scenario_rows.append({
-                "ticker": symbol,
-                "name": base["name"],
-                "current_price": base["current_price"],
-                "conservative_price": cons["dcf_price"],
-                "base_price": base["dcf_price"],
-                "optimistic_price": opt["dcf_price"],
-                "wacc": base["wacc"],
-                "rf": base["rf"],
-                "tax_rate": base["tax_rate"],
-            })
-
-            base_detail_rows.append(base)
-
-            # --- sensitivity (base scenario) ---
-            sens_df = sensitivity_grid(symbol, cfg, growth_multiplier=cfg.growth_mult_base)
-            sens_rows.append(sens_df)
+    prune_cache()
 
-            print(f"Done: {symbol}")
+    # one batched request for every last close instead of one per ticker
+    closes = fetch_closes(symbols)
+
+    # per-ticker start times, written by the worker as soon as it picks the ticker up,
+    # so queued tickers don't burn their timeout while waiting for a free worker
+    started: dict[int, float] = {}
 
-        except Exception as e:
-            print(f"Error processing {symbol}: {e}")
+    def _timed(i: int, symbol: str) -> tuple[tuple, dict, list[dict]]:
+        started[i] = time.monotonic()
+        return process_ticker(symbol, cfg, closes.get(symbol))
+
+    results: dict[int, tuple[tuple, dict, list[dict]]] = {}
+
+    ex = ThreadPoolExecutor(max_workers=cfg.max_workers)
+    futures = {ex.submit(_timed, i, s): (i, s) for i, s in enumerate(symbols)}
+    pending = set(futures)
+
+    # all reporting happens here on the main thread so lines never interleave
+    while pending:
+        done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+
+        for fut in done:
+            i, symbol = futures[fut]
+            try:
+                results[i] = fut.result()
+            except _TICKER_ERRORS as e:
+                print(f"Error processing {symbol}: {e}")
+                continue
+            except Exception as e:
+                # unexpected bug for one ticker: log it and keep the rest of the batch
+                print(f"Error processing {symbol}: unexpected {type(e).__name__}: {e}")
+                continue
+            print(f"Done: {symbol}")
 
-    scenarios_df = pd.DataFrame(scenario_rows)
+        now = time.monotonic()
+        for fut in list(pending):
+            i, symbol = futures[fut]
+            t0 = started.get(i)
+            if t0 is not None and now - t0 > cfg.ticker_timeout_s:
+                pending.discard(fut)
+                print(f"Error processing {symbol}: timed out after {cfg.ticker_timeout_s:.0f}s")
+
+    # Nothing is pending any more; a timed-out thread can't be killed, so don't block on it
+    # here (the interpreter still joins it at exit, bounded by yfinance's request timeouts)
+    ex.shutdown(wait=False, cancel_futures=True)
+
+    # collect in input order so output rows stay stable run-to-run
+    for i in sorted(results):
+        scenario_record, base, sens = results[i]
+        scenario_arr[i] = scenario_record
+        scenario_ok[i] = True
+        base_detail_rows.append(base)
+        sens_rows.extend(sens)
+
+    scenarios_df = pd.DataFrame(scenario_arr[scenario_ok])
     base_details_df = pd.DataFrame(base_detail_rows)
 
-    scenarios_df.to_csv(out_dir / "dcf_results_scenarios_wide.csv", index=False)
+    write_csv(scenarios_df, out_dir / "dcf_results_scenarios_wide.csv")
 
     # Power BI-friendly long format
     scenarios_long = to_powerbi_long(scenarios_df)
-    scenarios_long.to_csv(out_dir / "dcf_results_scenarios_long.csv", index=False)
+    write_csv(scenarios_long, out_dir / "dcf_results_scenarios_long.csv")
 
-    base_details_df.to_csv(out_dir / "dcf_results_base_details.csv", index=False)
+    write_csv(base_details_df, out_dir / "dcf_results_base_details.csv")
 
     if sens_rows:
-        sensitivity_all = pd.concat(sens_rows, ignore_index=True)
-        sensitivity_all.to_csv(out_dir / "dcf_results_sensitivity_long.csv", index=False)
+        write_records_csv(sens_rows, out_dir / "dcf_results_sensitivity_long.csv")
 
     print(f"\nSaved to: {out_dir.resolve()}")
     print("- dcf_results_scenarios_wide.csv")
@@ -37,3 +37,9 @@ class DCFConfig:
     # Sensitivity grid
     sens_wacc_bps: tuple[int, ...] = (-200, -100, 0, 100, 200)  # +/- 2%
     sens_tg_bps: tuple[int, ...] = (-50, -25, 0, 25, 50)        # +/- 0.50%
+
+    # Concurrency (per-ticker work is I/O bound on Yahoo)
+    max_workers: int = 8
+    # Per-ticker budget, measured from when a worker starts that ticker; slower
+    # tickers are reported as timed out and left out of the outputs
+    ticker_timeout_s: float = 30.0
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from curl_cffi import requests as curl_requests
+from joblib import Memory
+
+from src.financials import safe_history_close
+
+# One HTTP session handed to every yfinance call (tickers, ^TNX, batch download).
+# yfinance already shares a single session process-wide through its YfData singleton,
+# so this saves no handshakes by itself; it makes the client explicit and gives one
+# place to configure it. curl_cffi with browser impersonation is what yfinance uses
+# by default (it also accepts a plain requests.Session).
+SESSION = curl_requests.Session(impersonate="chrome")
+
+# On-disk cache so reruns on the same day skip the Yahoo round-trips entirely
+memory = Memory(location=".yf_cache", verbose=0)
+
+def prune_cache() -> None:
+    """
+    Drop cache entries not used in the last day. Entries are keyed by date, so
+    anything older is never hit again and would otherwise pile up per symbol per day.
+    """
+    memory.reduce_size(age_limit=dt.timedelta(days=1))
+
+@memory.cache
+def _cached_fundamentals(symbol: str, date_key: str) -> dict:
+    """
+    date_key is only part of the cache key: a new day means a fresh fetch.
+    Statements + info only; price is market data and is fetched separately.
+    Raises instead of returning an unusable bundle, so joblib never caches a failed fetch.
+    """
+    t = yf.Ticker(symbol, session=SESSION)
+    bundle = {
+        "info": t.info or {},
+        "cashflow": t.cashflow,
+        "balancesheet": t.balancesheet,
+        "financials": t.financials,
+    }
+
+    # yfinance hides fetch errors (rate limits included) behind empty results
+    if not bundle["info"]:
+        raise ValueError("Empty info from Yahoo")
+    for key in ("financials", "balancesheet"):
+        if bundle[key] is None or bundle[key].empty:
+            raise ValueError(f"Empty {key} from Yahoo")
+    return bundle
+
+def fetch_closes(symbols: list[str]) -> dict[str, float]:
+    """
+    Last close for every symbol in one batched yf.download call.
+    Symbols with no usable price are left out (callers fall back to a per-ticker fetch).
+    """
+    if not symbols:
+        return {}
+    data = yf.download(symbols, period="5d", threads=True, progress=False, session=SESSION)
+    if data is None or data.empty:
+        return {}
+
+    closes = data["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(symbols[0].upper())
+
+    # yf.download upper-cases symbols, so look them up that way (keys stay as given)
+    out = {}
+    for symbol in symbols:
+        col = symbol.upper()
+        if col not in closes.columns:
+            continue
+        s = closes[col].dropna()
+        if not s.empty and np.isfinite(s.iloc[-1]):
+            out[symbol] = float(s.iloc[-1])
+    return out
+
+def fetch_fundamentals(symbol: str, current_price: float | None = None) -> dict:
+    """
+    Pull everything the DCF needs for one symbol from a single yf.Ticker.
+    The bundle is reused across scenarios + sensitivity so we only hit Yahoo once per ticker,
+    and is cached on disk for the rest of the day.
+    Pass current_price (e.g. from fetch_closes) to skip the per-ticker price history call.
+    """
+    bundle = dict(_cached_fundamentals(symbol, dt.date.today().isoformat()))
+    if current_price is None:
+        current_price = safe_history_close(yf.Ticker(symbol, session=SESSION))
+    bundle["price"] = float(current_price)
+    return bundle
@@ -9,18 +9,29 @@ def safe_history_close(ticker: yf.Ticker) -> float:
         raise ValueError("Missing price history")
     return float(h.iloc[-1])
 
+def _row_values(df: pd.DataFrame | None, labels: list[str]) -> np.ndarray:
+    """
+    First row label with any data, as a float64 array (df column order, NaN kept).
+    Empty array if none found.
+    One hashed index lookup for all candidate labels, then raw NumPy on the values buffer.
+    """
+    if df is None or df.empty:
+        return np.empty(0, dtype=np.float64)
+    pos = df.index.get_indexer_for(labels)
+    values = df.values
+    for i in pos[pos >= 0]:
+        v = np.asarray(values[i], dtype=np.float64)
+        if np.isfinite(v).any():
+            return v
+    return np.empty(0, dtype=np.float64)
+
 def get_row(df: pd.DataFrame | None, labels: list[str]) -> float:
     """
     Try multiple possible row names. Return np.nan if none found.
     """
-    if df is None or df.empty:
-        return float("nan")
-    for lab in labels:
-        if lab in df.index:
-            s = df.loc[lab].dropna()
-            if not s.empty:
-                return float(s.iloc[0])
-    return float("nan")
+    v = _row_values(df, labels)
+    v = v[np.isfinite(v)]
+    return float(v[0]) if v.size else float("nan")
 
 def get_series(df: pd.DataFrame | None, label: str) -> pd.Series:
     """
@@ -28,11 +39,33 @@ def get_series(df: pd.DataFrame | None, label: str) -> pd.Series:
     """
     if df is None or df.empty:
         return pd.Series(dtype=float)
-    if label not in df.index:
+    pos = df.index.get_indexer_for([label])
+    if pos.size == 0 or pos[0] < 0:
         return pd.Series(dtype=float)
-    s = df.loc[label].dropna()
+    s = df.iloc[pos[0]].dropna()
     return s
 
+def _recent_median_ratio(values: np.ndarray, df: pd.DataFrame, revenue: pd.Series) -> float:
+    """
+    Median of values/revenue over the last up to 5 finite periods.
+    Aligns df's columns to revenue's index (dates), following revenue's oldest -> newest order.
+    Duplicate date columns keep their first occurrence (get_indexer needs unique labels).
+    """
+    cols = df.columns
+    if not cols.is_unique:
+        first = ~cols.duplicated()
+        cols = cols[first]
+        values = values[first]
+
+    pos = cols.get_indexer(revenue.index)
+    keep = pos >= 0
+    if not keep.any():
+        return float("nan")
+
+    r = values[pos[keep]] / revenue.to_numpy(dtype=np.float64)[keep]
+    r = r[np.isfinite(r)]
+    return float(np.median(r[-5:])) if r.size else float("nan")
+
 def best_effort_cash(balance_sheet: pd.DataFrame | None) -> float:
     cash = get_row(balance_sheet, [
         "Cash And Cash Equivalents",
@@ -92,29 +125,15 @@ def best_effort_working_capital_ratio(balance_sheet: pd.DataFrame | None, revenu
     if balance_sheet is None or balance_sheet.empty or revenue is None or revenue.empty:
         return 0.0
 
-    wc = get_series(balance_sheet, "Working Capital")
-    if wc.empty:
-        ca = get_series(balance_sheet, "Current Assets")
-        cl = get_series(balance_sheet, "Current Liabilities")
-        if not ca.empty and not cl.empty:
+    wc = _row_values(balance_sheet, ["Working Capital"])
+    if wc.size == 0:
+        ca = _row_values(balance_sheet, ["Current Assets"])
+        cl = _row_values(balance_sheet, ["Current Liabilities"])
+        if ca.size and cl.size:
             wc = ca - cl
 
-    if wc.empty:
-        return 0.0
-
-    # Align on common columns and compute ratio
-    common = wc.index.intersection(revenue.index)
-    if len(common) == 0:
-        return 0.0
-
-    wc2 = wc.loc[common].astype(float)
-    rev2 = revenue.loc[common].astype(float)
-
-    ratio = (wc2 / rev2).replace([np.inf, -np.inf], np.nan).dropna()
-    if ratio.empty:
-        return 0.0
-
-    return float(ratio.tail(min(5, len(ratio))).median())
+    ratio = _recent_median_ratio(wc, balance_sheet, revenue) if wc.size else float("nan")
+    return ratio if np.isfinite(ratio) else 0.0
 
 def best_effort_capex_ratio(cashflow: pd.DataFrame | None, revenue: pd.Series) -> float | None:
     """
@@ -125,22 +144,9 @@ def best_effort_capex_ratio(cashflow: pd.DataFrame | None, revenue: pd.Series) -
     if cashflow is None or cashflow.empty or revenue is None or revenue.empty:
         return None
 
-    capex = get_series(cashflow, "Capital Expenditure")
-    if capex.empty:
-        capex = get_series(cashflow, "CapitalExpenditures")
-
-    if capex.empty:
-        return None
-
-    common = capex.index.intersection(revenue.index)
-    if len(common) == 0:
-        return None
-
-    capex2 = capex.loc[common].astype(float).abs()
-    rev2 = revenue.loc[common].astype(float)
-
-    ratio = (capex2 / rev2).replace([np.inf, -np.inf], np.nan).dropna()
-    if ratio.empty:
+    capex = _row_values(cashflow, ["Capital Expenditure", "CapitalExpenditures"])
+    if capex.size == 0:
         return None
 
-    return float(ratio.tail(min(5, len(ratio))).median())
+    ratio = _recent_median_ratio(np.abs(capex), cashflow, revenue)
+    return ratio if np.isfinite(ratio) else None
@@ -1,21 +1,83 @@
 from __future__ import annotations
+import os
+from pathlib import Path
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+try:
+    import polars as pl  # optional: faster multi-threaded CSV writer
+except ImportError:
+    pl = None
 
 def read_tickers(path: str) -> pd.DataFrame:
-    if path.lower().endswith(".xlsx"):
-        return pd.read_excel(path)
-    return pd.read_csv(path)
+    """
+    .xlsx inputs get a parquet sidecar (path + ".parquet") so Excel is only parsed
+    again when the source file changes.
+    """
+    if not path.lower().endswith(".xlsx"):
+        return pd.read_csv(path)
+
+    cache_path = path + ".parquet"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return pd.read_parquet(cache_path)
+
+    df = pd.read_excel(path)
+    try:
+        df.to_parquet(cache_path, index=False)
+    except (OSError, ValueError, TypeError, pa.ArrowException):
+        pass  # read-only folder or mixed-type columns: the cache is optional, the read is not
+    return df
 
 def to_powerbi_long(results_wide: pd.DataFrame) -> pd.DataFrame:
     """
     Convert scenario wide columns into long format for Power BI:
       ticker | scenario | dcf_price
+    scenario is categorical: conservative / base / optimistic.
     """
     id_cols = [c for c in results_wide.columns if c not in ("conservative_price", "base_price", "optimistic_price")]
     long_df = results_wide.melt(
         id_vars=id_cols,
         value_vars=["conservative_price", "base_price", "optimistic_price"],
         var_name="scenario",
-        value_name="dcf_price"
+        value_name="dcf_price",
+        ignore_index=True
+    )
+    long_df["scenario"] = pd.Categorical(
+        long_df["scenario"].str.removesuffix("_price"),
+        categories=["conservative", "base", "optimistic"]
     )
     return long_df
+
+def _write_table(table: pa.Table, path: str | Path) -> None:
+    """
+    The one CSV writer every output goes through, so all files share a format.
+    Dictionary (categorical) and large_string columns are cast to plain strings first.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+        elif pa.types.is_large_string(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+    pacsv.write_csv(table, str(path))
+
+def write_csv(df: pd.DataFrame, path: str | Path) -> None:
+    """
+    Write df (no index) via Arrow's C++ CSV writer instead of pandas' row writer.
+    Format differs from to_csv: header + strings always quoted, 12.0 written as 12,
+    NaN as an empty field (see README "Output CSV format").
+    """
+    _write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+
+def write_records_csv(rows: list[dict], path: str | Path) -> None:
+    """
+    Write flat dict rows to CSV. With polars installed the frame is built there
+    (columnar, no pandas object inference); either way the bytes come from
+    _write_table, so the file is identical with or without polars.
+    """
+    if pl is not None:
+        # NaN -> null so it is written as an empty field, as from_pandas does
+        _write_table(pl.DataFrame(rows).fill_nan(None).to_arrow(), path)
+        return
+    write_csv(pd.DataFrame(rows), path)
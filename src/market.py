@@ -1,15 +1,17 @@
 from __future__ import annotations
+import functools
+
 import numpy as np
 import yfinance as yf
 
+from src.fetch import SESSION
+
+_PREMIUM = {"AU": 0.06, "US": 0.055}
+
 def get_market_premium(region: str = "AU") -> float:
-    r = region.upper()
-    if r == "AU":
-        return 0.06
-    if r == "US":
-        return 0.055
-    return 0.06
+    return _PREMIUM.get(region.upper(), 0.06)
 
+@functools.lru_cache(maxsize=8)
 def fetch_risk_free_rate(region: str, fallback: float) -> float:
     """
     Yahoo Finance has inconsistent tickers for non-US gov yields.
@@ -17,11 +19,12 @@ def fetch_risk_free_rate(region: str, fallback: float) -> float:
       - Try US ^TNX only if region == US
       - Otherwise use fallback
     You can later extend this to use a proper AU 10Y series if you have one.
+    Memoized per (region, fallback) so ^TNX is fetched at most once per run.
     """
     r = region.upper()
     if r == "US":
         try:
-            ten_year = yf.Ticker("^TNX")
+            ten_year = yf.Ticker("^TNX", session=SESSION)
             rf_raw = ten_year.history(period="5d")["Close"].dropna().iloc[-1]
             rf = float(rf_raw / 100.0)
             if np.isfinite(rf) and 0.0 < rf < 0.20:
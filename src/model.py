@@ -1,56 +1,152 @@
 from __future__ import annotations
+from typing import NamedTuple
+
 import numpy as np
-import yfinance as yf
+import pandas as pd
+from numba import njit
 
 from src.config import DCFConfig
-from src.market import (
-    get_market_premium, fetch_risk_free_rate,
-    cost_of_equity, clamp, calculate_wacc
-)
+from src.fetch import fetch_fundamentals
+from src.market import get_market_premium, fetch_risk_free_rate, calculate_wacc
 from src.financials import (
-    safe_history_close,
     best_effort_cash, best_effort_total_debt,
     best_effort_revenue_series, best_effort_ebit_series, best_effort_da_series,
     best_effort_interest_expense, best_effort_tax_and_pretax,
     best_effort_working_capital_ratio, best_effort_capex_ratio
 )
 
-def present_value(cash_flows: np.ndarray, discount_rate: float) -> np.ndarray:
+def present_value(cash_flows: np.ndarray, discount_rate: float | np.ndarray) -> np.ndarray:
+    """
+    PV of each year's flow. discount_rate may be an array: its shape is
+    broadcast against the flows on a new trailing "year" axis.
+    """
     cash_flows = np.asarray(cash_flows, dtype=float)
-    return np.array([cf / (1 + discount_rate) ** t for t, cf in enumerate(cash_flows, start=1)], dtype=float)
-
-def terminal_value(last_fcf: float, g: float, r: float) -> float:
-    # ensure r > g
-    if r <= g:
-        r = g + 0.01
-    return float((last_fcf * (1 + g)) / (r - g))
+    t = np.arange(1, cash_flows.size + 1)
+    return cash_flows / np.power(1.0 + np.asarray(discount_rate, dtype=float)[..., None], t)
+
+def terminal_value(last_fcf: float, g: float | np.ndarray, r: float | np.ndarray) -> float | np.ndarray:
+    # ensure r > g (elementwise, so the sensitivity grid can pass arrays)
+    r = np.where(r <= g, g + 0.01, r)
+    return (last_fcf * (1 + g)) / (r - g)
+
+def discounted_price(
+    unlevered_fcf: np.ndarray,
+    wacc: float | np.ndarray,
+    terminal_g: float | np.ndarray,
+    terminal_year: int,
+    cash: float,
+    total_debt: float,
+    shares: float
+) -> float | np.ndarray:
+    """
+    Equity value per share from projected FCFF: PV of flows + PV of Gordon terminal value.
+    wacc / terminal_g broadcast (sensitivity_grid passes a WACC column and a growth row).
+    """
+    pv_fcf = present_value(unlevered_fcf, wacc).sum(axis=-1)
+    tv = terminal_value(float(unlevered_fcf[-1]), terminal_g, wacc)
+    tv_pv = tv / (1 + np.asarray(wacc, dtype=float)) ** terminal_year
+    return (pv_fcf + tv_pv + cash - total_debt) / shares
 
 def build_growth_path(initial_growth: float, years: int, terminal_g: float, fade_start: int) -> np.ndarray:
-    growth_rates = []
-    for year in range(1, years + 1):
-        if year <= fade_start:
-            g = initial_growth
+    # flat at initial_growth through fade_start, then linear fade to terminal_g
+    out = np.empty(years, dtype=float)
+    out[:fade_start] = initial_growth
+    total_fade_years = max(years - fade_start, 1)
+    fade_t = np.arange(1, years - fade_start + 1)
+    out[fade_start:] = initial_growth + (terminal_g - initial_growth) * (fade_t / total_fade_years)
+    return out
+
+@njit(cache=True)
+def _dcf_kernel(
+    last_revenue, growth_path, ebit_margin, tax_rate, da_ratio, capex_ratio, wc_ratio,
+    fallback_capex_extra
+):
+    """
+    Numeric core of the DCF: revenue forecast -> projected unlevered FCF per year.
+    Plain floats/ndarrays only. capex_ratio = nan means "use the D&A + extra fallback".
+    """
+    n = growth_path.size
+    unlevered_fcf = np.empty(n)
+    use_capex_ratio = np.isfinite(capex_ratio)
+
+    prev_rev = last_revenue
+    for i in range(n):
+        rev = prev_rev * (1.0 + growth_path[i])
+        ebiat = rev * ebit_margin * (1.0 - tax_rate)
+        da = rev * da_ratio
+        if use_capex_ratio:
+            capex = rev * capex_ratio
         else:
-            t = year - fade_start
-            total_fade_years = max(years - fade_start, 1)
-            g = initial_growth + (terminal_g - initial_growth) * (t / total_fade_years)
-        growth_rates.append(g)
-    return np.array(growth_rates, dtype=float)
-
-def dcf_one(
+            # fallback heuristic: D&A plus small growth reinvestment
+            capex = da + fallback_capex_extra * rev
+        # ΔWC = (WC/Rev) * ΔRev
+        delta_wc = wc_ratio * (rev - prev_rev)
+
+        unlevered_fcf[i] = ebiat + da - capex - delta_wc
+        prev_rev = rev
+
+    return unlevered_fcf
+
+def _aligned_values(s: pd.Series, index: pd.Index) -> np.ndarray:
+    """
+    s reindexed onto index (NaN where missing) as a contiguous float64 array.
+    Duplicate labels in s keep their first occurrence (reindex needs unique labels).
+    """
+    if not s.index.is_unique:
+        s = s[~s.index.duplicated()]
+    return np.ascontiguousarray(s.reindex(index).to_numpy(dtype=np.float64, na_value=np.nan))
+
+def _recent_finite_median(x: np.ndarray) -> float:
+    """
+    Median of the last up to 5 finite values; nan if there are none.
+    """
+    x = x[np.isfinite(x)]
+    return float(np.median(x[-5:])) if x.size else float("nan")
+
+class FlowBundle(NamedTuple):
+    """
+    Everything derived from one ticker's fundamentals for one growth scenario:
+    discounting inputs, the projected unlevered FCFs and the base-WACC DCF price.
+    """
+    name: str
+    current_price: float
+    shares: float
+    cash: float
+    total_debt: float
+    rf: float
+    market_premium: float
+    tax_rate: float
+    pretax_cost_of_debt: float
+    wacc: float
+    base_avg_growth: float
+    scenario_initial_growth: float
+    ebit_margin_median: float
+    da_ratio_median: float
+    wc_ratio_median: float
+    capex_ratio_used: float
+    unlevered_fcf: np.ndarray
+    dcf_price: float
+
+def projected_flows(
     symbol: str,
     cfg: DCFConfig,
-    growth_multiplier: float = 1.0
-) -> dict:
-    t = yf.Ticker(symbol)
-
-    info = t.info or {}
-    cashflow = t.cashflow
-    balance_sheet = t.balancesheet
-    income_statement = t.financials
+    growth_multiplier: float,
+    fundamentals: dict | None
+) -> FlowBundle:
+    """
+    Shared pipeline for dcf_one and sensitivity_grid: fundamentals -> WACC + projected FCFF.
+    """
+    # Reuse a pre-fetched bundle when the caller has one (avoids refetching per scenario)
+    if fundamentals is None:
+        fundamentals = fetch_fundamentals(symbol)
+
+    info = fundamentals["info"]
+    cashflow = fundamentals["cashflow"]
+    balance_sheet = fundamentals["balancesheet"]
+    income_statement = fundamentals["financials"]
 
     # Price & shares
-    current_price = safe_history_close(t)
+    current_price = fundamentals["price"]
     shares = info.get("sharesOutstanding")
     if shares is None or float(shares) <= 0:
         raise ValueError("Missing or zero sharesOutstanding")
@@ -80,15 +176,16 @@ def dcf_one(
     raw_tax = np.nan
     if np.isfinite(tax_expense) and np.isfinite(pretax_income) and pretax_income > 0:
         raw_tax = tax_expense / pretax_income
-    tax_rate = clamp(raw_tax, cfg.tax_rate_min, cfg.tax_rate_max, cfg.default_tax_rate)
+    # inlined clamp(): raw_* are always plain floats here, so skip the call + coercion
+    tax_rate = cfg.default_tax_rate if not np.isfinite(raw_tax) else min(max(raw_tax, cfg.tax_rate_min), cfg.tax_rate_max)
 
     raw_cod = np.nan
     if np.isfinite(interest_expense) and total_debt > 0:
         raw_cod = float(interest_expense / total_debt)
-    pretax_cost_of_debt = clamp(raw_cod, cfg.cod_min, cfg.cod_max, cfg.default_cost_of_debt)
+    pretax_cost_of_debt = cfg.default_cost_of_debt if not np.isfinite(raw_cod) else min(max(raw_cod, cfg.cod_min), cfg.cod_max)
 
-    # WACC
-    eq_cost = cost_of_equity(float(beta), rf, market_premium)
+    # WACC (CAPM cost of equity inlined)
+    eq_cost = rf + float(beta) * market_premium
     wacc = calculate_wacc(total_debt, float(market_cap), pretax_cost_of_debt, eq_cost, tax_rate)
 
     # Historical series
@@ -98,25 +195,30 @@ def dcf_one(
     if revenue.empty or ebit.empty:
         raise ValueError("Missing revenue/EBIT series")
 
-    # reverse to oldest -> newest
+    # reverse to oldest -> newest; the Series keeps the dates used to align other statements
     revenue = revenue.dropna()[::-1].astype(float)
-    ebit = ebit.dropna()[::-1].astype(float)
-
     if len(revenue) < 2:
         raise ValueError("Not enough revenue history")
 
-    revenue_growth = revenue.pct_change().dropna()
+    # freeze to contiguous float64 buffers once; everything below is plain NumPy
+    revenue_arr = np.ascontiguousarray(revenue.to_numpy(dtype=np.float64))
+    ebit_arr = _aligned_values(ebit, revenue.index)
+    da_arr = _aligned_values(best_effort_da_series(income_statement), revenue.index)
+
+    revenue_growth = np.diff(revenue_arr) / revenue_arr[:-1]
+    revenue_growth = revenue_growth[np.isfinite(revenue_growth)]
+    if revenue_growth.size == 0:
+        raise ValueError("Cannot compute revenue growth")
     base_avg_growth = float(revenue_growth.mean())
     scenario_initial_growth = base_avg_growth * growth_multiplier
 
-    ebit_margin = (ebit / revenue).replace([np.inf, -np.inf], np.nan).dropna()
-    if ebit_margin.empty:
+    ebit_margin_median = _recent_finite_median(ebit_arr / revenue_arr)
+    if not np.isfinite(ebit_margin_median):
         raise ValueError("Cannot compute EBIT margin")
-    ebit_margin_median = float(ebit_margin.tail(min(5, len(ebit_margin))).median())
 
-    da = best_effort_da_series(income_statement).dropna()[::-1].astype(float)
-    da_ratio = (da / revenue).replace([np.inf, -np.inf], np.nan).dropna()
-    da_ratio_median = float(da_ratio.tail(min(5, len(da_ratio))).median()) if not da_ratio.empty else 0.03
+    da_ratio_median = _recent_finite_median(da_arr / revenue_arr)
+    if not np.isfinite(da_ratio_median):
+        da_ratio_median = 0.03
 
     wc_ratio_median = best_effort_working_capital_ratio(balance_sheet, revenue)
 
@@ -131,55 +233,65 @@ def dcf_one(
         fade_start=cfg.fade_start
     )
 
-    last_revenue = float(revenue.iloc[-1])
-    forecast_revenues = []
-    rev = last_revenue
-    for g in growth_path:
-        rev *= (1 + g)
-        forecast_revenues.append(rev)
-    forecast_revenues = np.array(forecast_revenues, dtype=float)
-
-    # Forecast operating items
-    forecast_ebit = forecast_revenues * ebit_margin_median
-    forecast_ebiat = forecast_ebit * (1 - tax_rate)
-
-    forecast_da = forecast_revenues * da_ratio_median
+    last_revenue = float(revenue_arr[-1])
+    capex_ratio_used = float(capex_ratio) if capex_ratio is not None and np.isfinite(capex_ratio) else np.nan
 
-    if capex_ratio is not None and np.isfinite(capex_ratio):
-        forecast_capex = forecast_revenues * float(capex_ratio)
-    else:
-        # fallback heuristic: D&A plus small growth reinvestment
-        forecast_capex = forecast_da + cfg.fallback_capex_extra_pct_of_rev * forecast_revenues
-
-    # ΔWC = (WC/Rev) * ΔRev
-    rev_series = np.concatenate(([last_revenue], forecast_revenues))
-    delta_wc = np.array([wc_ratio_median * (rev_series[i] - rev_series[i - 1]) for i in range(1, len(rev_series))], dtype=float)
-
-    unlevered_fcf = forecast_ebiat + forecast_da - forecast_capex - delta_wc
+    unlevered_fcf = _dcf_kernel(
+        last_revenue, growth_path, ebit_margin_median, tax_rate, da_ratio_median, capex_ratio_used,
+        wc_ratio_median, cfg.fallback_capex_extra_pct_of_rev
+    )
+    dcf_price = discounted_price(
+        unlevered_fcf, wacc, cfg.terminal_growth, cfg.terminal_year, cash, total_debt, float(shares)
+    )
 
-    # PV + Terminal
-    pv_fcf = present_value(unlevered_fcf, wacc)
-    tv = terminal_value(float(unlevered_fcf[-1]), cfg.terminal_growth, wacc)
-    tv_pv = tv / (1 + wacc) ** cfg.terminal_year
+    return FlowBundle(
+        name=name,
+        current_price=float(current_price),
+        shares=float(shares),
+        cash=float(cash),
+        total_debt=float(total_debt),
+        rf=float(rf),
+        market_premium=float(market_premium),
+        tax_rate=float(tax_rate),
+        pretax_cost_of_debt=float(pretax_cost_of_debt),
+        wacc=float(wacc),
+        base_avg_growth=float(base_avg_growth),
+        scenario_initial_growth=float(scenario_initial_growth),
+        ebit_margin_median=float(ebit_margin_median),
+        da_ratio_median=float(da_ratio_median),
+        wc_ratio_median=float(wc_ratio_median),
+        capex_ratio_used=capex_ratio_used,
+        unlevered_fcf=unlevered_fcf,
+        dcf_price=float(dcf_price)
+    )
 
-    ev = float(pv_fcf.sum() + tv_pv)
-    equity_value = ev + cash - total_debt
-    dcf_price = float(equity_value / float(shares))
 
+def dcf_from_flows(symbol: str, f: FlowBundle) -> dict:
+    """
+    Result row for an already-projected scenario (lets callers share one FlowBundle).
+    """
     return {
         "ticker": symbol,
-        "name": name,
-        "current_price": float(current_price),
-        "dcf_price": dcf_price,
-        "wacc": float(wacc),
-        "rf": float(rf),
-        "market_premium": float(market_premium),
-        "tax_rate": float(tax_rate),
-        "pretax_cost_of_debt": float(pretax_cost_of_debt),
-        "base_avg_growth": float(base_avg_growth),
-        "scenario_initial_growth": float(scenario_initial_growth),
-        "ebit_margin_median": float(ebit_margin_median),
-        "da_ratio_median": float(da_ratio_median),
-        "wc_ratio_median": float(wc_ratio_median),
-        "capex_ratio_used": float(capex_ratio) if capex_ratio is not None and np.isfinite(capex_ratio) else np.nan
+        "name": f.name,
+        "current_price": f.current_price,
+        "dcf_price": f.dcf_price,
+        "wacc": f.wacc,
+        "rf": f.rf,
+        "market_premium": f.market_premium,
+        "tax_rate": f.tax_rate,
+        "pretax_cost_of_debt": f.pretax_cost_of_debt,
+        "base_avg_growth": f.base_avg_growth,
+        "scenario_initial_growth": f.scenario_initial_growth,
+        "ebit_margin_median": f.ebit_margin_median,
+        "da_ratio_median": f.da_ratio_median,
+        "wc_ratio_median": f.wc_ratio_median,
+        "capex_ratio_used": f.capex_ratio_used
     }
+
+def dcf_one(
+    symbol: str,
+    cfg: DCFConfig,
+    growth_multiplier: float = 1.0,
+    fundamentals: dict | None = None
+) -> dict:
+    return dcf_from_flows(symbol, projected_flows(symbol, cfg, growth_multiplier, fundamentals))